@@ -1,14 +1,18 @@
 # app.py
-import io, zipfile, traceback, os
+import hashlib, io, shutil, tempfile, zipfile, traceback, os
 from flask import Flask, render_template, request, send_file, jsonify
 from stegano_core import (
+    MARKER,
+    LENGTH_LEN,
     create_payload_zip_from_files,
     create_payload_zip_from_bytes,
+    create_payload_zst,
+    extract_zst_to_bytes,
     encrypt_payload,
     decrypt_payload,
     pack_stego,
     unpack_stego,
-    sha256_hex_bytes,
+    unpack_stego_fd,
     bytes_to_human,
     append_history,
     read_history_html,
@@ -21,6 +25,40 @@ from stegano_core import (
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024  # 300MB uploads allowed
 
+# Uploads above this spill to a tempfile so the EOF marker search runs over
+# an mmap instead of a carrier-sized bytes object.
+LARGE_UPLOAD_BYTES = 16 * 1024 * 1024
+
+def _strip_lsb_header(payload_with_header):
+    if not payload_with_header.startswith(MARKER):
+        raise ValueError("LSB payload missing marker")
+    ln = int.from_bytes(payload_with_header[len(MARKER):len(MARKER)+LENGTH_LEN], "big")
+    return payload_with_header[len(MARKER)+LENGTH_LEN:len(MARKER)+LENGTH_LEN+ln]
+
+def _recover_payload(stego, password):
+    """Pull the embedded payload out of an uploaded stego file, trying EOF
+    mode first and LSB second. Returns (payload, mode)."""
+    stego.stream.seek(0, 2)
+    size = stego.stream.tell()
+    stego.stream.seek(0)
+    if size > LARGE_UPLOAD_BYTES:
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".stego")
+        try:
+            stego.save(tmp)
+            tmp.close()
+            try:
+                return unpack_stego_fd(tmp.name), "eof"
+            except Exception:
+                with open(tmp.name, "rb") as fh:
+                    return _strip_lsb_header(extract_lsb(fh, password)), "lsb"
+        finally:
+            os.unlink(tmp.name)
+    full = stego.read()
+    try:
+        return unpack_stego(full), "eof"
+    except Exception:
+        return _strip_lsb_header(extract_lsb(full, password)), "lsb"
+
 @app.route("/")
 def index():
     history_html = read_history_html()
@@ -32,10 +70,11 @@ def estimate():
     try:
         carrier = request.files.get("carrier")
         carrier_size = 0
-        carrier_bytes = b""
         if carrier:
-            carrier_bytes = carrier.read()
-            carrier_size = len(carrier_bytes)
+            # size and capacity come from the spooled stream; no full read
+            carrier.stream.seek(0, 2)
+            carrier_size = carrier.stream.tell()
+            carrier.stream.seek(0)
         secret_text = request.form.get("secret_text", "")
         secret_files = request.files.getlist("secret_files")
         payload_zip = create_payload_zip_from_files(secret_text, secret_files)
@@ -43,7 +82,7 @@ def estimate():
         plnd = b"PLND" + payload_zip
         payload_len = len(plnd)
         # LSB capacity (bytes)
-        lsb_cap = lsb_capacity_bytes(carrier_bytes) if carrier_bytes else 0
+        lsb_cap = lsb_capacity_bytes(carrier.stream) if carrier_size else 0
         return jsonify({
             "carrier_size": carrier_size,
             "payload_size": payload_len,
@@ -63,8 +102,8 @@ def embed():
         if not carrier or carrier.filename == "":
             return jsonify({"error": "Carrier file required"}), 400
 
-        # Read carrier and keep its original extension
-        carrier_bytes = carrier.read()
+        # Keep the carrier's original extension; its bytes are only pulled
+        # into memory on the EOF path (LSB works off the upload stream)
         carrier_name = carrier.filename
         carrier_ext = os.path.splitext(carrier_name)[1]  # e.g. ".png", ".jpg", ".mp4"
         if not carrier_ext:
@@ -73,8 +112,14 @@ def embed():
         secret_text = request.form.get("secret_text", "")
         secret_files = request.files.getlist("secret_files")
 
-        # Build payload zip
-        payload_zip = create_payload_zip_from_files(secret_text, secret_files)
+        # Build payload container: zip (default) or tar.zst
+        container = request.form.get("container", "zip")
+        if container == "zst":
+            payload_data = create_payload_zst(secret_text, secret_files)
+            enc_marker, plain_marker = b"ENCZ", b"PLDZ"
+        else:
+            payload_data = create_payload_zip_from_files(secret_text, secret_files)
+            enc_marker, plain_marker = b"ENCR", b"PLND"
 
         if request.form.get("encrypt") == "on":
             pwd = request.form.get("password", "")
@@ -82,31 +127,31 @@ def embed():
                 return jsonify({"error": "Password required for encryption"}), 400
             if not is_strong_password(pwd):
                 return jsonify({"error": "Password too weak. Use min 10 chars including uppercase, lowercase, digits, symbol."}), 400
-            payload = encrypt_payload(payload_zip, pwd)
+            payload = encrypt_payload(payload_data, pwd, marker=enc_marker)
         else:
-            payload = b"PLND" + payload_zip
+            payload = plain_marker + payload_data
 
         # Choose mode: 'eof' or 'lsb'
         mode = request.form.get("mode", "eof")
         if mode == "lsb":
             # embed header + payload into image LSB using optional password-based PRNG
             headered = payload
-            from stegano_core import MARKER, LENGTH_LEN
             payload_for_lsb = MARKER + len(headered).to_bytes(LENGTH_LEN, "big") + headered
             # check capacity
-            cap = lsb_capacity_bytes(carrier_bytes)
+            cap = lsb_capacity_bytes(carrier.stream)
             if cap < len(payload_for_lsb):
                 return jsonify({"error": f"Image capacity too small for LSB embedding. Needs {len(payload_for_lsb)} bytes, capacity {cap} bytes."}), 400
             pwd = request.form.get("password", "")  # use same password as provided for encryption optionally
-            stego = embed_lsb(carrier_bytes, payload_for_lsb, pwd)
-            sha = sha256_hex_bytes(stego)
+            stego, sha = embed_lsb(carrier.stream, payload_for_lsb, pwd)
             append_history(f"LSB-embedded and saved stego (in-memory) SHA-256: {sha}")
             # always return .png for LSB output
             return send_file(io.BytesIO(stego), as_attachment=True, download_name=f"stego_output.png")
         else:
-            # EOF append
-            stego = pack_stego(carrier_bytes, payload)
-            sha = sha256_hex_bytes(stego)
+            # EOF append (hash folded into assembly; no second pass)
+            carrier_bytes = carrier.read()
+            hasher = hashlib.sha256()
+            stego = pack_stego(carrier_bytes, payload, hasher=hasher)
+            sha = hasher.hexdigest()
             append_history(f"EOF-embedded and saved stego (in-memory) SHA-256: {sha}")
             # Save with original extension instead of .bin
             return send_file(io.BytesIO(stego), as_attachment=True,
@@ -123,50 +168,42 @@ def extract_info():
         stego = request.files.get("stego")
         if not stego:
             return jsonify({"error":"Stego file required"}), 400
-        full = stego.read()
-
-        # Try EOF first; if that fails, try LSB
-        payload = None
-        prefix = None
+        # Try EOF first; if that fails, try LSB (password drives PRNG ordering)
         try:
-            payload = unpack_stego(full)
-            prefix = "eof"
-        except Exception:
-            # try LSB (pass provided password for PRNG ordering)
-            try:
-                pwd = request.form.get("password", "")
-                payload_with_header = extract_lsb(full, pwd)  # returns MARKER+LENGTH+payload
-                from stegano_core import MARKER, LENGTH_LEN
-                if not payload_with_header.startswith(MARKER):
-                    raise ValueError("LSB payload missing marker")
-                ln = int.from_bytes(payload_with_header[len(MARKER):len(MARKER)+LENGTH_LEN], "big")
-                payload = payload_with_header[len(MARKER)+LENGTH_LEN:len(MARKER)+LENGTH_LEN+ln]
-                prefix = "lsb"
-            except Exception as e:
-                raise ValueError(f"Unable to find embedded payload (neither EOF nor LSB). Details: {str(e)}")
+            payload, prefix = _recover_payload(stego, request.form.get("password", ""))
+        except Exception as e:
+            raise ValueError(f"Unable to find embedded payload (neither EOF nor LSB). Details: {str(e)}")
 
-        if payload.startswith(b"ENCR"):
+        if payload.startswith((b"ENCR", b"ENCZ")):
             pwd = request.form.get("password", "")
             if not pwd:
                 return jsonify({"error":"Password required for encrypted payload"}), 400
+            container = "zst" if payload.startswith(b"ENCZ") else "zip"
             data = decrypt_payload(payload, pwd)
         elif payload.startswith(b"PLND"):
+            container = "zip"
+            data = payload[4:]
+        elif payload.startswith(b"PLDZ"):
+            container = "zst"
             data = payload[4:]
         else:
             return jsonify({"error":"Unknown payload type"}), 400
 
-        zf = zipfile.ZipFile(io.BytesIO(data), "r")
-        names = zf.namelist()
-        preview = ""
-        if "secret_text.txt" in names:
-            try:
-                preview = zf.read("secret_text.txt").decode(errors="ignore")
-            except Exception:
-                preview = ""
-        files_info = []
-        for name in names:
-            b = zf.read(name)
-            files_info.append({"name": name, "size": len(b)})
+        if container == "zst":
+            members = extract_zst_to_bytes(data)
+            preview = members.get("secret_text.txt", b"").decode(errors="ignore")
+            files_info = [{"name": name, "size": len(b)} for name, b in members.items()]
+        else:
+            zf = zipfile.ZipFile(io.BytesIO(data), "r")
+            infos = zf.infolist()
+            preview = ""
+            if any(info.filename == "secret_text.txt" for info in infos):
+                try:
+                    preview = zf.read("secret_text.txt").decode(errors="ignore")
+                except Exception:
+                    preview = ""
+            # sizes come from the central directory; no need to decompress members
+            files_info = [{"name": info.filename, "size": info.file_size} for info in infos]
         append_history(f"Extracted {len(files_info)} files from stego (preview). Mode guessed: {prefix}")
         return jsonify({"files": files_info, "preview": preview})
     except Exception as e:
@@ -181,32 +218,28 @@ def download_payload():
         stego = request.files.get("stego")
         if not stego:
             return jsonify({"error":"Stego file required"}), 400
-        full = stego.read()
-
         # attempt EOF then LSB (use provided password)
-        payload = None
-        try:
-            payload = unpack_stego(full)
-        except Exception:
-            # LSB
-            pwd = request.form.get("password", "")
-            payload_with_header = extract_lsb(full, pwd)
-            from stegano_core import MARKER, LENGTH_LEN
-            if not payload_with_header.startswith(MARKER):
-                raise ValueError("LSB payload missing marker")
-            ln = int.from_bytes(payload_with_header[len(MARKER):len(MARKER)+LENGTH_LEN], "big")
-            payload = payload_with_header[len(MARKER)+LENGTH_LEN:len(MARKER)+LENGTH_LEN+ln]
+        payload, _ = _recover_payload(stego, request.form.get("password", ""))
 
-        if payload.startswith(b"ENCR"):
+        if payload.startswith((b"ENCR", b"ENCZ")):
             pwd = request.form.get("password", "")
             if not pwd:
                 return jsonify({"error":"Password required for encrypted payload"}), 400
+            container = "zst" if payload.startswith(b"ENCZ") else "zip"
             data = decrypt_payload(payload, pwd)
         elif payload.startswith(b"PLND"):
+            container = "zip"
+            data = payload[4:]
+        elif payload.startswith(b"PLDZ"):
+            container = "zst"
             data = payload[4:]
         else:
             return jsonify({"error":"Unknown payload type"}), 400
 
+        if container == "zst":
+            # frontend always expects a zip download; repack the tar.zst members
+            data = create_payload_zip_from_bytes("", extract_zst_to_bytes(data))
+
         append_history("Saved whole extracted zip.")
         return send_file(io.BytesIO(data), as_attachment=True, download_name="extracted_payload.zip")
     except Exception as e:
@@ -232,17 +265,17 @@ def download_selected_raw():
         selected = request.form.getlist("selected[]")
 
         if len(selected) == 1:
-            # Return raw file in original format
+            # Return raw file in original format, streamed from the zip member
             fname = selected[0]
-            data = zf.read(fname)
-            return send_file(io.BytesIO(data), as_attachment=True,
+            return send_file(zf.open(fname), as_attachment=True,
                              download_name=fname, mimetype="application/octet-stream")
 
-        # Multiple → return zip
+        # Multiple → return zip; copy member streams without buffering whole files
         out = io.BytesIO()
         with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zout:
             for name in selected:
-                zout.writestr(name, zf.read(name))
+                with zf.open(name) as src, zout.open(name, "w") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
         out.seek(0)
         return send_file(out, as_attachment=True,
                          download_name="selected_files.zip",
@@ -1,12 +1,23 @@
 # stegano_core.py
-import os, io, zipfile, secrets, hashlib, re, traceback, random
+import os, io, mmap, zipfile, tarfile, secrets, hashlib, re, struct, traceback, threading, atexit, queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from PIL import Image
 import numpy as np
 
+try:
+    import zstandard
+except ImportError:  # optional; only needed for the zst payload container
+    zstandard = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # optional accelerator; NumPy paths below are the fallback
+    njit = None
+
 # ------------------ Constants ------------------ #
 MARKER = b"STEG0"
 LENGTH_LEN = 8
@@ -31,14 +42,28 @@ def sha256_hex_bytes(b: bytes) -> str:
     h.update(b)
     return h.hexdigest()
 
+def sha256_hex_stream(fileobj) -> str:
+    """Hash a binary file-like object in fixed-size chunks without
+    materializing its contents; leaves the position at EOF."""
+    return hashlib.file_digest(fileobj, "sha256").hexdigest()
+
+class HashingBytesIO(io.BytesIO):
+    """BytesIO that feeds every write through a hash object, so sequential
+    writers (e.g. PIL's PNG encoder) get hashed without a second pass."""
+    def __init__(self, hasher):
+        super().__init__()
+        self._hasher = hasher
+
+    def write(self, b):
+        n = super().write(b)
+        self._hasher.update(b)
+        return n
+
+# one compiled pattern with lookaheads instead of four separate scans
+_PW_RE = re.compile(r"^(?=.*[A-Z])(?=.*[a-z])(?=.*[0-9])(?=.*[^A-Za-z0-9]).{10,}$", re.DOTALL)
+
 def is_strong_password(pwd: str) -> bool:
-    return (
-        len(pwd) >= 10 and
-        re.search(r"[A-Z]", pwd) and
-        re.search(r"[a-z]", pwd) and
-        re.search(r"[0-9]", pwd) and
-        re.search(r"[^A-Za-z0-9]", pwd)
-    )
+    return bool(_PW_RE.match(pwd))
 
 # Safe zip extraction to bytes dict (prevents zip slip)
 def safe_extract_to_bytes(zf: zipfile.ZipFile, members=None):
@@ -52,10 +77,17 @@ def safe_extract_to_bytes(zf: zipfile.ZipFile, members=None):
         out[member] = zf.read(member)
     return out
 
+# Magics of formats that are already compressed (JPEG, PNG, zip, gzip) or
+# encrypted — deflating them burns CPU for no size win, so store them as-is.
+_ALREADY_COMPRESSED = (b"\xff\xd8\xff", b"\x89PNG", b"PK\x03\x04", b"\x1f\x8b", b"\x28\xb5\x2f\xfd", b"ENCR", b"ENCZ")
+
+def _zip_compress_type(content: bytes) -> int:
+    return zipfile.ZIP_STORED if content.startswith(_ALREADY_COMPRESSED) else zipfile.ZIP_DEFLATED
+
 # Create payload zip from file-like objects (Werkzeug FileStorage)
 def create_payload_zip_from_files(secret_text: str, secret_files):
     bio = io.BytesIO()
-    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as zf:
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
         if secret_text and secret_text.strip():
             zf.writestr("secret_text.txt", secret_text)
         seen = set()
@@ -74,12 +106,12 @@ def create_payload_zip_from_files(secret_text: str, secret_files):
             content = f.read()
             if isinstance(content, str):
                 content = content.encode()
-            zf.writestr(target, content)
+            zf.writestr(target, content, compress_type=_zip_compress_type(content))
     return bio.getvalue()
 
 def create_payload_zip_from_bytes(secret_text: str, files_dict: dict):
     bio = io.BytesIO()
-    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED) as zf:
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
         if secret_text and secret_text.strip():
             zf.writestr("secret_text.txt", secret_text)
         seen = set()
@@ -93,24 +125,87 @@ def create_payload_zip_from_bytes(secret_text: str, files_dict: dict):
                 target = f"{root}_{i}{ext}"
                 i += 1
             seen.add(target)
-            zf.writestr(target, data)
+            zf.writestr(target, data, compress_type=_zip_compress_type(data))
+    return bio.getvalue()
+
+# Alternative container: tar piped through zstd level 3 (~3x faster than
+# DEFLATE on compressible text). Marked PLDZ (plain) / ENCZ (encrypted).
+def create_payload_zst(secret_text: str, secret_files) -> bytes:
+    if zstandard is None:
+        raise RuntimeError("zstandard package not installed; zst container unavailable.")
+    bio = io.BytesIO()
+    cctx = zstandard.ZstdCompressor(level=3)
+    with cctx.stream_writer(bio, closefd=False) as writer:
+        with tarfile.open(fileobj=writer, mode="w|") as tf:
+            def add(name, data):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+            if secret_text and secret_text.strip():
+                add("secret_text.txt", secret_text.encode())
+            seen = set()
+            for f in secret_files:
+                if not hasattr(f, "filename") or not f.filename:
+                    continue
+                name = os.path.basename(f.filename)
+                target = name
+                i = 1
+                while target in seen:
+                    root, ext = os.path.splitext(name)
+                    target = f"{root}_{i}{ext}"
+                    i += 1
+                seen.add(target)
+                content = f.read()
+                if isinstance(content, str):
+                    content = content.encode()
+                add(target, content)
     return bio.getvalue()
 
+def extract_zst_to_bytes(data: bytes) -> dict:
+    if zstandard is None:
+        raise RuntimeError("zstandard package not installed; zst container unavailable.")
+    out = {}
+    dctx = zstandard.ZstdDecompressor()
+    with dctx.stream_reader(io.BytesIO(data)) as reader:
+        with tarfile.open(fileobj=reader, mode="r|") as tf:
+            for member in tf:
+                if member.isfile():
+                    out[member.name] = tf.extractfile(member).read()
+    return out
+
 # ------------------ Key derivation + encryption/decryption ------------------ #
-def derive_key(password: str, salt: bytes) -> bytes:
-    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=PBKDF2_ITERS)
-    return kdf.derive(password.encode())
+# Derived-key LRU: re-uploading the same stego with the same password is
+# common, and each miss costs 200k HMAC-SHA256 iterations. Keyed by a hash of
+# (password, salt) so plaintext passwords are never retained; 256 entries of
+# 32-byte keys is ~8 KB.
+_KEY_CACHE = OrderedDict()
+_KEY_CACHE_MAX = 256
 
-def encrypt_payload(payload: bytes, password: str) -> bytes:
+def derive_key(password: str, salt: bytes) -> bytes:
+    cache_key = hashlib.sha256(password.encode() + salt).digest()
+    key = _KEY_CACHE.get(cache_key)
+    if key is not None:
+        _KEY_CACHE.move_to_end(cache_key)
+        return key
+    # OpenSSL-backed PBKDF2 (uses SHA-NI where available); same parameters as
+    # before, so existing ENCR payloads still decrypt.
+    key = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERS, dklen=32)
+    _KEY_CACHE[cache_key] = key
+    if len(_KEY_CACHE) > _KEY_CACHE_MAX:
+        _KEY_CACHE.popitem(last=False)
+    return key
+
+def encrypt_payload(payload: bytes, password: str, marker: bytes = b"ENCR") -> bytes:
     salt = secrets.token_bytes(SALT_LEN)
     key = derive_key(password, salt)
     aesgcm = AESGCM(key)
     nonce = secrets.token_bytes(NONCE_LEN)
     ct = aesgcm.encrypt(nonce, payload, None)
-    return b"ENCR" + salt + nonce + ct
+    return marker + salt + nonce + ct
 
 def decrypt_payload(enc_bytes: bytes, password: str) -> bytes:
-    if not enc_bytes.startswith(b"ENCR"):
+    # ENCR wraps a zip container, ENCZ a tar.zst one; same layout either way
+    if not enc_bytes.startswith((b"ENCR", b"ENCZ")):
         raise ValueError("Payload not encrypted or invalid header.")
     off = 4
     salt = enc_bytes[off:off+SALT_LEN]; off += SALT_LEN
@@ -121,10 +216,34 @@ def decrypt_payload(enc_bytes: bytes, password: str) -> bytes:
     return aesgcm.decrypt(nonce, ct, None)
 
 # ------------------ EOF Mode (append) ------------------ #
-def pack_stego(carrier_bytes: bytes, payload: bytes) -> bytes:
+def pack_stego(carrier_bytes: bytes, payload: bytes, hasher=None) -> bytes:
     ln = len(payload).to_bytes(LENGTH_LEN, "big")
+    if hasher is not None:
+        # hash the parts as we assemble them; avoids re-walking the result
+        hasher.update(carrier_bytes)
+        hasher.update(MARKER + ln)
+        hasher.update(payload)
     return carrier_bytes + MARKER + ln + payload
 
+def unpack_stego_fd(path) -> bytes:
+    """
+    mmap-based unpack_stego for a stego file on disk: the marker search runs
+    over the mapping (glibc memmem, no bytes copy of the carrier) and only
+    the payload slice is materialized.
+    """
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            idx = mm.rfind(MARKER)
+            if idx == -1 or idx + len(MARKER) + LENGTH_LEN > len(mm):
+                raise ValueError("Marker not found or truncated.")
+            ln_off = idx + len(MARKER)
+            ln = int.from_bytes(mm[ln_off:ln_off+LENGTH_LEN], "big")
+            start = ln_off + LENGTH_LEN
+            end = start + ln
+            if end > len(mm):
+                raise ValueError("Invalid embedded length (corrupted container).")
+            return mm[start:end]
+
 def unpack_stego(full: bytes) -> bytes:
     idx = full.rfind(MARKER)
     if idx == -1 or idx + len(MARKER) + LENGTH_LEN > len(full):
@@ -138,118 +257,247 @@ def unpack_stego(full: bytes) -> bytes:
     return full[start:end]
 
 # ------------------ LSB Mode (pixel LSB) ------------------ #
-def _to_bitstring(b: bytes) -> str:
-    return "".join(f"{byte:08b}" for byte in b)
-
-def _from_bitstring(bits: str) -> bytes:
-    if len(bits) % 8 != 0:
-        raise ValueError("Bitstring length not multiple of 8")
-    out = bytearray()
-    for i in range(0, len(bits), 8):
-        out.append(int(bits[i:i+8], 2))
-    return bytes(out)
-
+@lru_cache(maxsize=128)
 def _seed_from_password(password: str):
-    """Return deterministic integer seed derived from password or None if empty."""
+    """Return deterministic integer seed derived from password or None if empty.
+    Cached: server workloads hash the same password on every embed/extract."""
     if not password:
         return None
     h = hashlib.sha256(password.encode()).digest()
     # use 64 bits to seed PRNG deterministically
     return int.from_bytes(h[:8], "big")
 
-def lsb_capacity_bytes(carrier_bytes: bytes) -> int:
+# Scatter/gather of payload bits over the (possibly shuffled) pixel indices.
+# With Numba present these compile to parallel SIMD loops; otherwise NumPy
+# fancy indexing does the same work in one pass.
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _scatter_bits(flat, indices, bits):
+        for i in prange(indices.size):
+            flat[indices[i]] = (flat[indices[i]] & 0xFE) | bits[i]
+
+    @njit(parallel=True, cache=True)
+    def _gather_bits(flat, indices):
+        out = np.empty(indices.size, dtype=np.uint8)
+        for i in prange(indices.size):
+            out[i] = flat[indices[i]] & 1
+        return out
+else:
+    def _scatter_bits(flat, indices, bits):
+        flat[indices] &= 0xFE
+        flat[indices] |= bits
+
+    def _gather_bits(flat, indices):
+        return flat[indices] & 1
+
+def _partial_order(size: int, n_bits: int, rng) -> np.ndarray:
+    """
+    First n_bits indices of a Fisher-Yates shuffle of range(size), computed
+    lazily over a dict so work is O(n_bits) instead of O(size). The swap
+    targets are drawn in one vectorized call, so the first k results are the
+    same for any n_bits >= k (needed to read the header before the length).
+    """
+    draws = rng.integers(np.arange(n_bits, dtype=np.int64), size)
+    out = np.empty(n_bits, dtype=np.int64)
+    swapped = {}
+    for i in range(n_bits):
+        j = int(draws[i])
+        out[i] = swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+    return out
+
+@lru_cache(maxsize=8)
+def _order(size: int, n_bits: int, password: str, full=None) -> np.ndarray:
+    """
+    Return the first n_bits indices used for LSB bit placement: sequential
+    when no password, otherwise a deterministic shuffle seeded from the
+    password. Philox is pinned explicitly so the order is stable across
+    NumPy versions. Small payloads get a partial shuffle (O(n_bits)); large
+    ones a full C-level permutation; `full` forces one or the other so
+    extraction can match whichever family embedding picked.
+    Cached: embed-then-verify with the same password and image size recomputes
+    the identical order, so hand back a shared read-only array instead.
+    """
+    seed = _seed_from_password(password)
+    if seed is None:
+        arr = np.arange(n_bits, dtype=np.int64)
+    else:
+        rng = np.random.default_rng(np.random.Philox(seed))
+        if full is None:
+            full = 4 * n_bits > size
+        if full:
+            # copy the slice so the cache doesn't pin the full-size base array
+            arr = rng.permutation(size)[:n_bits].copy()
+        else:
+            arr = _partial_order(size, n_bits, rng)
+    arr.setflags(write=False)
+    return arr
+
+def _as_stream(src):
+    """Accept bytes or a seekable binary file-like (e.g. an upload's spooled
+    stream) and return it rewound; avoids forcing callers to materialize
+    large uploads as bytes just to hand them to PIL."""
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return io.BytesIO(src)
+    src.seek(0)
+    return src
+
+def lsb_capacity_bytes(carrier) -> int:
     """
     Return how many bytes can be embedded using LSB in this image (RGB).
+    Accepts bytes or a file-like. Only the dimensions matter (embedding
+    converts to RGB), so read them from the PNG IHDR directly, or via
+    Image.open without decoding pixels.
     """
-    try:
-        img = Image.open(io.BytesIO(carrier_bytes)).convert("RGB")
-    except Exception:
-        return 0
-    w, h = img.size
+    stream = _as_stream(carrier)
+    head = stream.read(24)
+    stream.seek(0)
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24:
+        w, h = struct.unpack(">II", head[16:24])
+    else:
+        try:
+            with Image.open(stream) as img:
+                w, h = img.size
+            stream.seek(0)
+        except Exception:
+            return 0
     total_bits = w * h * 3  # RGB channels
     return total_bits // 8
 
-def embed_lsb(carrier_bytes: bytes, payload: bytes, password: str = "") -> bytes:
+# PNG encoding runs zlib, which releases the GIL, so encode on a worker
+# thread while the request thread hashes and collects chunks as they arrive.
+_PNG_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="png-encode")
+
+def _save_png_hashed(img):
+    """Encode img to PNG, returning (png_bytes, sha256_hex). The encoder runs
+    on a worker thread feeding a bounded queue; this thread drains it through
+    a HashingBytesIO so compression and hashing overlap."""
+    chunks = queue.Queue(maxsize=64)
+
+    class _QueueWriter(io.RawIOBase):
+        def writable(self):
+            return True
+
+        def write(self, b):
+            chunks.put(bytes(b))
+            return len(b)
+
+    def _encode():
+        try:
+            img.save(_QueueWriter(), format="PNG")
+        finally:
+            chunks.put(None)
+
+    fut = _PNG_EXECUTOR.submit(_encode)
+    h = hashlib.sha256()
+    out = HashingBytesIO(h)
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        out.write(chunk)
+    fut.result()  # propagate encoder errors
+    return out.getvalue(), h.hexdigest()
+
+def embed_lsb(carrier, payload: bytes, password: str = ""):
     """
-    Embed payload bytes into the LSBs of an image (carrier). Output PNG bytes.
+    Embed payload bytes into the LSBs of an image (carrier bytes or
+    file-like). Returns (png_bytes, sha256_hex); the digest is computed
+    while the PNG is encoded.
     Uses PRNG-based bit ordering if password provided (seed derived from password).
     Payload should include header (marker + length + actual bytes) like EOF mode.
     """
-    img = Image.open(io.BytesIO(carrier_bytes)).convert("RGB")
-    data = np.array(img)
-    flat = data.flatten()  # dtype = uint8
-
-    bits = _to_bitstring(payload)
-    if len(bits) > flat.size:
+    img = Image.open(_as_stream(carrier)).convert("RGB")
+    arr = np.asarray(img)
+    if not arr.flags.writeable:
+        arr = arr.copy()  # PIL hands out read-only buffers
+    flat = arr.reshape(-1)  # view, dtype = uint8; writes land in arr
+
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    if bits.size > flat.size:
         raise ValueError("Payload too large for image capacity.")
 
-    indices = list(range(flat.size))
-    seed = _seed_from_password(password)
-    if seed is not None:
-        rng = random.Random(seed)
-        rng.shuffle(indices)
-
-    # modify LSBs per index order (PRNG or sequential)
-    for i, bit in enumerate(bits):
-        idx = indices[i]
-        flat[idx] = (flat[idx] & 0xFE) | int(bit)
-
-    new_data = flat.reshape(data.shape).astype(np.uint8)
-    stego_img = Image.fromarray(new_data, mode="RGB")
-    out = io.BytesIO()
+    # modify LSBs per index order (PRNG or sequential), one vectorized store
+    sel = _order(flat.size, bits.size, password)
+    _scatter_bits(flat, sel, bits)
+
     # Save as PNG to be lossless and predictable
-    stego_img.save(out, format="PNG")
-    return out.getvalue()
+    return _save_png_hashed(Image.fromarray(arr, mode="RGB"))
 
-def extract_lsb(stego_bytes: bytes, password: str = "") -> bytes:
+def extract_lsb(stego, password: str = "") -> bytes:
     """
-    Extract the payload by:
+    Extract the payload from stego bytes or a file-like by:
     1) Reading header (MARKER + LENGTH_LEN bytes) first by reading their bits
        in PRNG order if password provided, otherwise sequentially.
     2) Reading the rest of payload based on length
     Returns the raw embedded bytes including marker+length+payload.
     """
-    img = Image.open(io.BytesIO(stego_bytes)).convert("RGB")
-    data = np.array(img).flatten()
-
-    indices = list(range(data.size))
-    seed = _seed_from_password(password)
-    if seed is not None:
-        rng = random.Random(seed)
-        rng.shuffle(indices)
+    img = Image.open(_as_stream(stego)).convert("RGB")
+    data = np.asarray(img).reshape(-1)  # read-only view is fine here
 
-    # Read header
+    # Read header. Embedding picks partial vs full shuffle from the payload
+    # size, which we don't know yet, so probe the header under both families.
     header_bytes_len = len(MARKER) + LENGTH_LEN
     header_bits_len = header_bytes_len * 8
-    if header_bits_len > len(indices):
+    if header_bits_len > data.size:
         raise ValueError("Image too small or corrupted (can't read header).")
 
-    header_bits = "".join(str(int(data[indices[i]] & 1)) for i in range(header_bits_len))
-    header_bytes = _from_bitstring(header_bits)
-    if not header_bytes.startswith(MARKER):
+    header_bytes = b""
+    full_flag = None
+    for flag in (False, True):
+        hdr_idx = _order(data.size, header_bits_len, password, full=flag)
+        header_bytes = np.packbits(_gather_bits(data, hdr_idx)).tobytes()
+        if header_bytes.startswith(MARKER):
+            full_flag = flag
+            break
+        if not password:
+            break  # sequential order ignores the flag; nothing else to try
+    if full_flag is None:
         raise ValueError("Marker not found in LSB data.")
 
     ln = int.from_bytes(header_bytes[len(MARKER):len(MARKER)+LENGTH_LEN], "big")
     payload_total_bytes = header_bytes_len + ln
     total_bits_needed = payload_total_bytes * 8
-    if total_bits_needed > len(indices):
+    if total_bits_needed > data.size:
         raise ValueError("Declared payload length exceeds image capacity or is corrupted.")
 
-    bits = "".join(str(int(data[indices[i]] & 1)) for i in range(total_bits_needed))
-    all_bytes = _from_bitstring(bits)
+    indices = _order(data.size, total_bits_needed, password, full=full_flag)
+    all_bytes = np.packbits(_gather_bits(data, indices)).tobytes()
     return all_bytes  # includes marker + length + payload
 
 # ------------------ History management ------------------ #
 def ensure_history_dir():
     HISTORY_DIR.mkdir(parents=True, exist_ok=True)
 
+# Keep one line-buffered handle open instead of open/close per event; the
+# lock covers concurrent Flask worker threads.
+_HIST_FH = None
+_HIST_LOCK = threading.Lock()
+
+def _history_fh():
+    global _HIST_FH
+    if _HIST_FH is None:
+        ensure_history_dir()
+        _HIST_FH = open(HISTORY_FILE, "a", buffering=1, encoding="utf-8")
+    return _HIST_FH
+
+def _close_history_fh():
+    global _HIST_FH
+    fh, _HIST_FH = _HIST_FH, None
+    if fh is not None:
+        try:
+            fh.close()
+        except Exception:
+            pass
+
+atexit.register(_close_history_fh)
+
 def append_history(text: str):
-    ensure_history_dir()
     stamp = __import__("datetime").datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     line = f"[{stamp}] {text}"
     try:
-        with open(HISTORY_FILE, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
+        with _HIST_LOCK:
+            _history_fh().write(line + "\n")
     except Exception:
         traceback.print_exc()
 
@@ -264,8 +512,10 @@ def read_history_html():
 
 def clear_history():
     ensure_history_dir()
-    try:
-        if HISTORY_FILE.exists():
-            HISTORY_FILE.unlink()
-    except Exception:
-        pass
+    with _HIST_LOCK:
+        _close_history_fh()  # else appends keep going to the unlinked file
+        try:
+            if HISTORY_FILE.exists():
+                HISTORY_FILE.unlink()
+        except Exception:
+            pass